@@ -3,8 +3,10 @@
 # TECHNICALLY THIS SHOULD BE THE ONLY FILE THAT NEEDS TO BE MODIFIED FOR CUSTOM EVENT SELECTIONS
 from src.analysis.evtselutil import BaseEventSelections
 from src.analysis.objutil import Object
+from tools.lazysel import LazySelMixin
+from tools.checkpoint import CheckpointMixin
 
-from config.projectconfg import namemap, selection
+from config.projectconfg import namemap, selection, runsetting
 import operator as opr
 import awkward as ak
 
@@ -20,6 +22,8 @@ def switch_selections(sel_name):
 default_trigsel = selection.triggerselections
 default_objsel = selection.objselections
 default_mapcfg = namemap
+default_lazy = runsetting.get('LAZY_SELECTION', False)
+default_ckptdir = runsetting.get('CHECKPOINT_DIR', None)
 
 class skimEvtSel(BaseEventSelections):
     """A class to skim the events based on the trigger and object selections."""
@@ -56,9 +60,9 @@ class skimEvtSel(BaseEventSelections):
         self.objsel.add_multiple({"Electron Veto": elec_nummask,
                                 "Muon Veto": muon_nummask})
 
-class twoTauEvtSel(BaseEventSelections):
-    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True) -> None:
-        super().__init__(trigcfg, objcfg, mapcfg, sequential)
+class twoTauEvtSel(CheckpointMixin, LazySelMixin, BaseEventSelections):
+    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True, lazy=default_lazy, ckptdir=default_ckptdir) -> None:
+        super().__init__(trigcfg, objcfg, mapcfg, sequential, lazy=lazy, ckptdir=ckptdir)
 
     def seltwotaus(self, events) -> ak.Array:
         tau = self.getObj("Tau", events)
@@ -90,12 +94,15 @@ class twoTauEvtSel(BaseEventSelections):
         return events
 
 class ControlEvtSel(twoTauEvtSel):
-    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True) -> None:
-        super().__init__(trigcfg, objcfg, mapcfg, sequential)
+    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True, lazy=default_lazy, ckptdir=default_ckptdir) -> None:
+        super().__init__(trigcfg, objcfg, mapcfg, sequential, lazy, ckptdir)
 
     def setevtsel(self, events) -> None:
-        events = self.seltwotaus(events)
-        
+        events = self.runstage('twotau', self.seltwotaus, events, deps=['Tau'])
+        events = self.runstage('jets', self.seljets, events, deps=['Jet'])
+        self.saveWeights(events)
+
+    def seljets(self, events) -> ak.Array:
         jet = self.getObj("Jet", events)
     
         def jobjmask(jet: 'Object'):
@@ -120,15 +127,18 @@ class ControlEvtSel(twoTauEvtSel):
         sd_j = jet.getld(mask=(~jet_mask) & jobjmask(jet), sort_by='pt')
         self.objcollect['SDBjet'] = sd_j
 
-        self.saveWeights(events)
+        return events
 
 class SignalEvtSel(twoTauEvtSel):
-    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True) -> None:
-        super().__init__(trigcfg, objcfg, mapcfg, sequential)
+    def __init__(self, trigcfg=default_trigsel, objcfg=default_objsel, mapcfg=default_mapcfg, sequential=True, lazy=default_lazy, ckptdir=default_ckptdir) -> None:
+        super().__init__(trigcfg, objcfg, mapcfg, sequential, lazy, ckptdir)
 
     def setevtsel(self, events) -> None:
-        events = self.seltwotaus(events)
+        events = self.runstage('twotau', self.seltwotaus, events, deps=['Tau'])
+        events = self.runstage('jets', self.seljets, events, deps=['Jet'])
+        self.saveWeights(events)
 
+    def seljets(self, events) -> ak.Array:
         jet = self.getObj('Jet', events)
         
         def jobjmask(jet: 'Object'):
@@ -149,15 +159,18 @@ class SignalEvtSel(twoTauEvtSel):
         self.objcollect['LDBjet'] = ld_j
         self.objcollect['SDBjet'] = sd_j[:,0]
 
-        self.saveWeights(events)
+        return events
 
 class PrelimEvtSel(twoTauEvtSel):
-    def __init__(self, trigcfg=default_trigsel, objselcfg=default_objsel, mapcfg=default_mapcfg, sequential=True) -> None:
-        super().__init__(trigcfg, objselcfg, mapcfg, sequential)
+    def __init__(self, trigcfg=default_trigsel, objselcfg=default_objsel, mapcfg=default_mapcfg, sequential=True, lazy=default_lazy, ckptdir=default_ckptdir) -> None:
+        super().__init__(trigcfg, objselcfg, mapcfg, sequential, lazy, ckptdir)
 
     def setevtsel(self, events):
-        events = self.seltwotaus(events)
+        events = self.runstage('twotau', self.seltwotaus, events, deps=['Tau'])
+        events = self.runstage('jets', self.seljets, events, deps=['Jet'])
+        self.saveWeights(events)
 
+    def seljets(self, events) -> ak.Array:
         jet = Object(events, name='Jet', selcfg=self.objselcfg['Jet'], mapcfg=self.mapcfg)
         
         def jobjmask(jet: 'Object'):
@@ -177,4 +190,4 @@ class PrelimEvtSel(twoTauEvtSel):
         ld_j = jet.getld(sort_by='btag', mask=jet_mask)
         self.objcollect['LDBjet'] = ld_j
 
-        self.saveWeights(events)
\ No newline at end of file
+        return events
\ No newline at end of file
@@ -1,15 +1,22 @@
 # ==============================================================================
 # Updated on: June 3, 2024
 # Used to: create dynamic job submissions for different datasets
+# Usage: ./jobsub.sh [-d] [-p NPILOTS] DYNACONF_ENV PROCESS YEAR
+#   -d: write the submission file without submitting
+#   -p: submit NPILOTS pilot jobs draining a shared queue instead of one job per job JSON
 # ==============================================================================
 
 DISABLE_SUBMISSION=false
+NPILOTS=0
 
-while getopts ":d" opt; do
+while getopts ":dp:" opt; do
   case ${opt} in
     d )
       DISABLE_SUBMISSION=true
       ;;
+    p )
+      NPILOTS=$OPTARG
+      ;;
     \? )
       echo "Invalid option: -$OPTARG" 1>&2
       exit 1
@@ -44,11 +51,28 @@ fi
 
 \cp -f hhbbtt.sub runtime/${DYNACONF_ENV}_${PROCESS}.sub
 
+# merge the chunk sizes returned by earlier jobs so the memory governor starts from them
+mkdir -p chunksizes
+(cd .. && python3 -m tools.memgovernor exec/chunksizes.json exec/chunksizes/*.json)
+
+if [ "$NPILOTS" -gt 0 ]; then
+    # pilot mode: queue the job JSONs on the shared filesystem and submit NPILOTS long-lived workers draining it
+    QUEUE_DIR=$(python3 -c 'from config.projectconfg import runsetting as rs; print(rs.get("PILOT_QUEUE", ""))')
+    QUEUE_DIR=${QUEUE_DIR:-${PWD}/queue}/${DYNACONF_ENV}_${PROCESS}
+    (cd .. && python3 -m tools.pilot ${QUEUE_DIR} --add exec/${FILENAME})
+cat << EOF >> runtime/${DYNACONF_ENV}_${PROCESS}.sub
+DYNACONF = ${DYNACONF_ENV}
+JOB_DIRNAME = ${JOB_DIRNAME}
+arguments = ${QUEUE_DIR} \$(DYNACONF) pilot
+queue ${NPILOTS}
+EOF
+else
 cat << EOF >> runtime/${DYNACONF_ENV}_${PROCESS}.sub
 DYNACONF = ${DYNACONF_ENV}
 JOB_DIRNAME = ${JOB_DIRNAME}
 queue FILENAME matching files ${FILENAME}
 EOF
+fi
 
 if [ "$DISABLE_SUBMISSION" = false ]; then
     condor_submit runtime/${DYNACONF_ENV}_${PROCESS}.sub
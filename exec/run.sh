@@ -46,5 +46,10 @@ checkproxy
 # export PYTHONFAULTHANDLER=1
 # export PYTHONVERBOSE=1
 
-python -u main.py --input ${JSONPATH} --diagnose
+if [ "$3" == "pilot" ]; then
+    # JSONPATH is the shared work queue directory in pilot mode
+    python -u main.py --pilot ${JSONPATH}
+else
+    python -u main.py --input ${JSONPATH} --diagnose
+fi
 # gdb --args python -u main.py --input ${JSONPATH} --diagnose
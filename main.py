@@ -7,7 +7,6 @@ from config.customEvtSel import switch_selections
 
 def runselections():
     gc.enable()
-    from src.analysis.spawnjobs import JobRunner
 
     parser = argparse.ArgumentParser(
             description='''Run event selections for data analysis.
@@ -18,10 +17,14 @@ def runselections():
     Arguments:
     - --input: Path to the input file containing data to be processed. See example input files in example/ directory.
     - --diagnose: Enable memory diagnostics to track memory usage during execution.
+    - --pilot: Run as a pilot, processing job JSONs claimed from the given queue directory until it is empty. Overrides --input.
+    - --scan: Evaluate the grid of working points in the `scan` block of selection.yaml instead of the nominal selection.
             '''
         )
     parser.add_argument('--input', type=str, help='input file path', default=None)
     parser.add_argument('--diagnose', action='store_true', default=False, help='Enable memory diagnose')
+    parser.add_argument('--pilot', type=str, help='work queue directory to claim jobs from', default=None)
+    parser.add_argument('--scan', action='store_true', default=False, help='Run the threshold scan over the selection.yaml scan grid')
     args = parser.parse_args()
     
     if args.diagnose:
@@ -32,15 +35,124 @@ def runselections():
     
     selectionclass = switch_selections(runsetting.SEL_NAME)
 
-    jr = JobRunner(runsetting, args.input, selectionclass, dasksetting)
-    print("======================================================================")
-    print("Enter Main Python program: Event selection Mode!")
-    print("======================================================================")
-    jr.submitjobs(client=None)
+    if args.pilot:
+        print("======================================================================")
+        print("Enter Main Python program: Pilot Mode!")
+        print("======================================================================")
+        runpilot(args.pilot, selectionclass, scan=args.scan)
+    elif args.scan:
+        print("======================================================================")
+        print("Enter Main Python program: Threshold scan Mode!")
+        print("======================================================================")
+        runscan(args.input, selectionclass)
+    else:
+        print("======================================================================")
+        print("Enter Main Python program: Event selection Mode!")
+        print("======================================================================")
+        runjob(args.input, selectionclass)
     
     if args.diagnose:
         snapshot = tracemalloc.take_snapshot()
         display_top(snapshot)
 
+def runjob(jobfile, selectionclass):
+    """Run the event selection on one job JSON. With MEMORY_BUDGET set, the files are processed in chunks
+    sized by the memory governor instead of handing the whole job to JobRunner. With CHECKPOINT_DIR set, the files
+    are processed one step range at a time so that stage checkpoints are keyed by the uuid and step range.
+    
+    Return
+    - int, 0 on success, otherwise the first non-zero return code."""
+    if not runsetting.get('MEMORY_BUDGET', None) and not runsetting.get('CHECKPOINT_DIR', None):
+        from src.analysis.spawnjobs import JobRunner
+        return JobRunner(runsetting, jobfile, selectionclass, dasksetting).submitjobs(client=None) or 0
+
+    import json
+    from src.analysis.processor import Processor
+    from tools.memgovernor import MemoryGovernor
+    from tools.checkpoint import keyed_selection
+
+    with open(jobfile, 'r') as f:
+        job = json.load(f)
+
+    transferP = job['metadata'].get('transferP', None)
+    outdirs = set()
+    def process(subjob):
+        proc = Processor(runsetting, subjob, transferP=transferP, evtselclass=keyed_selection(selectionclass, subjob))
+        outdirs.add(proc.outdir)
+        return proc.runfiles(write_npz=False)
+
+    def cleanup(subjob):
+        """Remove the local outputs an aborted range left behind. Output names carry the sub-job uuid."""
+        import glob
+        uuid = next(iter(subjob['files'].values()))['uuid']
+        for outdir in outdirs:
+            for path in glob.glob(os.path.join(outdir, f'*{uuid}[-_.]*')):
+                os.remove(path)
+
+    if runsetting.get('MEMORY_BUDGET', None):
+        governor = MemoryGovernor(runsetting.MEMORY_BUDGET, threshold=runsetting.get('MEMORY_THRESHOLD', 0.85),
+                                  min_chunk=runsetting.get('MIN_CHUNK', 1000), recordpath=runsetting.get('CHUNK_RECORD', None))
+        status = governor(job, process, cleanup=cleanup)
+        print(f"Peak memory {governor.peak/1024**3:.2f}GB, return code {status}")
+    else:
+        status = 0
+        for filename, fileinfo in job['files'].items():
+            for start, stop in fileinfo.get('steps') or [[0, fileinfo['num_entries']]]:
+                # outputs are named by uuid: suffix it with the range start like the governor so ranges do not overwrite each other
+                result = process({'files': {filename: {**fileinfo, 'steps': [[start, stop]], 'uuid': f"{fileinfo.get('uuid', '')}-{start}"}},
+                                  'metadata': job['metadata']})
+                status = status or result
+        print(f"Return code {status}")
+    return status
+
+def runscan(jobfile, selectionclass):
+    """Evaluate all working points of the scan grid on each file of the job, reading every file once."""
+    import json
+    from src.analysis.processor import Processor
+    from src.utils.filesysutil import XRootDHelper, pjoin
+    from config.projectconfg import selection, namemap
+    from tools.scan import ThresholdScan
+    from tools.checkpoint import keyed_selection
+
+    with open(jobfile, 'r') as f:
+        job = json.load(f)
+
+    proc = Processor(runsetting, job, transferP=None, evtselclass=selectionclass)
+    scan = ThresholdScan(selectionclass, selection.scan, selection.triggerselections, selection.objselections, namemap)
+    print(f"Scanning {len(scan.points)} working points")
+
+    cutflows = []
+    for filename, fileinfo in job['files'].items():
+        filejob = {'files': {filename: fileinfo}, 'metadata': job['metadata']}
+        scan.evtselclass = keyed_selection(selectionclass, filejob)
+        events = proc.loadfile_remote(filejob)
+        cutflows.append(scan(events))
+        del events
+        gc.collect()
+
+    prefix = os.path.splitext(os.path.basename(jobfile))[0]
+    scan.write(ThresholdScan.combine(cutflows), proc.outdir, prefix)
+    if runsetting.get('TRANSFER_PATH', None):
+        XRootDHelper().transfer_files(proc.outdir, pjoin(runsetting.TRANSFER_PATH, 'scan'), f'{prefix}_scan*', remove=True)
+
+def runpilot(queuedir, selectionclass, scan=False):
+    """Process job JSONs from the work queue until it is empty, reusing the environment set up for this process."""
+    from tools.pilot import WorkQueue, Pilot
+
+    def handler(jobfile):
+        """Raise on a non-zero return code so that the pilot releases the job for a retry or marks it failed."""
+        if scan:
+            runscan(jobfile, selectionclass)
+        else:
+            status = runjob(jobfile, selectionclass)
+            if status != 0:
+                raise RuntimeError(f"{jobfile} finished with return code {status}")
+        gc.collect()
+
+    queue = WorkQueue(queuedir, lease=runsetting.get('PILOT_LEASE', 600), max_attempts=runsetting.get('PILOT_MAX_ATTEMPTS', 3))
+    pilot = Pilot(queue, handler, heartbeat=runsetting.get('PILOT_HEARTBEAT', 60), idle_wait=runsetting.get('PILOT_IDLE_WAIT', None))
+    processed = pilot()
+    print(f"Pilot finished: {len(processed['done'])} jobs done, {len(processed['failed'])} jobs failed")
+
 if __name__ == '__main__':
     runselections()
\ No newline at end of file
@@ -0,0 +1,81 @@
+# Shared stand-ins for src.analysis classes, used by the tests of the tools/ selection mixins.
+import numpy as np
+import awkward as ak
+
+class MockObject:
+    """Stand-in for `Object`: exposes the `{name}_{var}` columns of the events as attributes."""
+    def __init__(self, events, name):
+        self.name = name
+        self.events = events
+
+    def __getattr__(self, var):
+        if var in ('name', 'events'):
+            raise AttributeError(var)
+        return self.events[f'{self.name}_{var}']
+
+class MockBaseSel:
+    """Stand-in for a sequential `BaseEventSelections`: filters events and objcollect after each cut and keeps a cutflow."""
+    def __init__(self, trigcfg, objcfg, mapcfg, sequential=True):
+        self.trigcfg = trigcfg
+        self.objselcfg = objcfg
+        self.mapcfg = mapcfg
+        self.sequential = sequential
+        self.objcollect = {}
+        self.cutflow = {}
+        self.saved = None
+        self.passed = []
+
+    def __call__(self, events):
+        """Entry point used by `Processor`."""
+        self.setevtsel(events)
+        return self.saved
+
+    def getObj(self, name, events):
+        return MockObject(events, name)
+
+    def selobjhelper(self, events, name, obj, mask):
+        self.passed.append(type(obj))
+        events = events[mask]
+        self.cutflow[name] = len(events)
+        for key, val in self.objcollect.items():
+            self.objcollect[key] = val[mask]
+        return self.getObj(obj.name, events), events
+
+    def saveWeights(self, events):
+        self.saved = events
+
+def mock_events(n=400, seed=0):
+    """Flat events array with jagged Tau/Jet columns, per-event ids and weights."""
+    rng = np.random.default_rng(seed)
+    ntau, njet = rng.integers(0, 4, n), rng.integers(0, 6, n)
+    return ak.zip({'event': np.arange(n) + seed * n,
+                   'Tau_pt': ak.unflatten(rng.uniform(20, 100, ntau.sum()), ntau),
+                   'Tau_idvsjet': ak.unflatten(rng.integers(1, 8, ntau.sum()), ntau),
+                   'Jet_pt': ak.unflatten(rng.uniform(10, 150, njet.sum()), njet),
+                   'Jet_btag': ak.unflatten(rng.uniform(0, 1, njet.sum()), njet),
+                   'Generator_weight': np.full(n, 0.5)}, depth_limit=1)
+
+class MockEvtSel(MockBaseSel):
+    """Two-tau and jet stages written like the selections in config/customEvtSel.py."""
+    calls = []
+    def seltwotaus(self, events):
+        MockEvtSel.calls.append('twotau')
+        tau = self.getObj('Tau', events)
+        taumask = (tau.pt > self.objselcfg['Tau']['pt']) & (tau.idvsjet >= self.objselcfg['Tau']['idvsjet'])
+        tau, events = self.selobjhelper(events, '>= 2 Taus', tau, ak.num(tau.pt[taumask]) >= 2)
+        self.objcollect['LDTau'] = ak.max(tau.pt, axis=1)
+        return events
+
+    def seljets(self, events):
+        MockEvtSel.calls.append('jets')
+        jet = self.getObj('Jet', events)
+        jetmask = jet.pt > self.objselcfg['Jet']['pt']
+        jet, events = self.selobjhelper(events, '>= 2 Jets', jet, ak.num(jet.pt[jetmask]) >= 2)
+        jet, events = self.selobjhelper(events, '>= 1 B-tagged', jet, ak.any(jet.btag[jet.pt > self.objselcfg['Jet']['pt']] >= self.objselcfg['Jet']['btag'], axis=1))
+        self.objcollect['LDBjet'] = ak.max(jet.pt, axis=1)
+        return events
+
+    def setevtsel(self, events):
+        events = self.seltwotaus(events)
+        events = self.seljets(events)
+        self.saveWeights(events)
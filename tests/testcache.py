@@ -0,0 +1,76 @@
+import unittest, os, tempfile, shutil
+import numpy as np
+import pandas as pd
+from dynaconf.utils.boxing import DynaBox
+
+from tools.trainingcache import TrainingCacheBuilder, TrainingCache
+
+pjoin = os.path.join
+
+class TestTrainingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.frames = {}
+        for region, n in [('RegionC', 120), ('RegionD', 80)]:
+            df = pd.DataFrame({'Bjet_InvM': rng.uniform(0, 300, n),
+                               'Tau_dR': rng.uniform(0, 5, n),
+                               'OS': rng.integers(0, 2, n).astype(bool),
+                               'group': rng.choice(['TTbar', 'DYJets'], n),
+                               'Gen_weight_values': rng.normal(size=n),
+                               'weight': rng.uniform(0.5, 1.5, n)})
+            df.to_csv(pjoin(self.tmpdir, f'{region}.csv'))
+            self.frames[region] = df
+        self.builder = TrainingCacheBuilder(pjoin(self.tmpdir, 'cache'), chunksize=50)
+        self.cache = self.builder({region: pjoin(self.tmpdir, f'{region}.csv') for region in self.frames}, drop_columns=['Gen'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_schema(self):
+        self.assertEqual(len(self.cache), 200)
+        self.assertNotIn('Gen_weight_values', self.cache.columns)
+        self.assertEqual(self.cache.column('Bjet_InvM').dtype, np.float32)
+        self.assertEqual(self.cache.column('weight').dtype, np.float64)
+        self.assertEqual(set(self.cache.features()), {'Bjet_InvM', 'Tau_dR', 'OS'})
+
+    def test_split(self):
+        train = self.cache.indices('train')
+        test = self.cache.indices('test')
+        self.assertEqual(len(test), 50)
+        self.assertEqual(len(np.intersect1d(train, test)), 0)
+        self.assertEqual(len(train) + len(test), len(self.cache))
+        reopened = TrainingCache(self.builder.outdir)
+        np.testing.assert_array_equal(reopened.indices('test'), test)
+
+    def test_reweighter_inputs(self):
+        ori, tar = self.cache.reweighter_inputs('RegionD', 'RegionC', columns=['Bjet_InvM'], where={'group': 'TTbar'})
+        expected = self.frames['RegionD'][self.frames['RegionD'].group == 'TTbar']
+        self.assertEqual(list(ori.columns), ['Bjet_InvM', 'weight'])
+        self.assertEqual(len(ori), len(expected))
+        np.testing.assert_allclose(ori['weight'].to_numpy(), expected['weight'].to_numpy())
+        self.assertEqual(len(tar), (self.frames['RegionC'].group == 'TTbar').sum())
+
+    def test_iterbatches(self):
+        seen = 0
+        for X, w, y in self.cache.iterbatches(batch_size=32, split='train', target='OS', seed=1):
+            self.assertEqual(X.shape[1], 2)
+            self.assertEqual(len(X), len(w))
+            self.assertEqual(len(X), len(y))
+            seen += len(X)
+        self.assertEqual(seen, len(self.cache.indices('train')))
+
+    def test_from_settings(self):
+        settings = DynaBox({'CACHE_DIR': pjoin(self.tmpdir, 'unused'), 'WEIGHT': 'weight', 'TEST_SIZE': 0.5,
+                            'DTYPE': 'float64', 'BATCH_SIZE': 64, 'DROP_COLUMNS': ['Gen', 'group']})
+        builder = TrainingCacheBuilder.from_settings(settings, outdir=pjoin(self.tmpdir, 'fromsettings'))
+        self.assertEqual(builder.outdir, pjoin(self.tmpdir, 'fromsettings'))
+        cache = builder({region: pjoin(self.tmpdir, f'{region}.csv') for region in self.frames})
+        self.assertEqual(set(cache.features()), {'Bjet_InvM', 'Tau_dR', 'OS'})
+        self.assertNotIn('group', cache.columns)
+        self.assertEqual(cache.column('Bjet_InvM').dtype, np.float64)
+        self.assertEqual(len(cache.indices('test')), 100)
+        self.assertEqual(max(len(X) for X, w, y in cache.iterbatches()), 64)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest, tempfile, shutil, os
+import awkward as ak
+
+from tools.checkpoint import CheckpointMixin, keyed_selection
+from tools.scan import ThresholdScan
+from tests.mocksel import MockEvtSel, mock_events
+
+class CkptMockEvtSel(CheckpointMixin, MockEvtSel):
+    def setevtsel(self, events):
+        events = self.runstage('twotau', self.seltwotaus, events, deps=['Tau'])
+        events = self.runstage('jets', self.seljets, events, deps=['Jet'])
+        self.saveWeights(events)
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.ckptdir = tempfile.mkdtemp()
+        self.events = mock_events(400)
+        MockEvtSel.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.ckptdir)
+
+    def run_sel(self, taupt=40, jetpt=20, ckptdir=True, events=None, uuid='abc'):
+        objcfg = {'Tau': {'pt': taupt, 'idvsjet': 3}, 'Jet': {'pt': jetpt, 'btag': 0.3}}
+        job = {'files': {'ZZ.root': {'uuid': uuid, 'steps': [[0, 400]]}}, 'metadata': {'shortname': 'ZZ'}}
+        evtselclass = keyed_selection(CkptMockEvtSel, job)
+        sel = evtselclass(None, objcfg, {}, True, ckptdir=self.ckptdir if ckptdir else None)
+        sel.setevtsel(self.events if events is None else events)
+        return sel
+
+    def test_resume_identical(self):
+        reference = self.run_sel(ckptdir=False)
+        first = self.run_sel()
+        self.assertEqual(len(os.listdir(self.ckptdir)), 2)
+        MockEvtSel.calls = []
+        second = self.run_sel()
+        self.assertEqual(MockEvtSel.calls, [])
+        for sel in (first, second):
+            self.assertEqual(sel.cutflow, reference.cutflow)
+            self.assertEqual(ak.to_list(sel.saved), ak.to_list(reference.saved))
+            self.assertEqual(ak.to_list(sel.objcollect['LDBjet']), ak.to_list(reference.objcollect['LDBjet']))
+            self.assertEqual(ak.to_list(sel.objcollect['LDTau']), ak.to_list(reference.objcollect['LDTau']))
+
+    def test_downstream_change(self):
+        self.run_sel()
+        MockEvtSel.calls = []
+        changed = self.run_sel(jetpt=50)
+        self.assertEqual(MockEvtSel.calls, ['jets'])
+        self.assertEqual(changed.cutflow, self.run_sel(jetpt=50, ckptdir=False).cutflow)
+
+    def test_upstream_change(self):
+        self.run_sel()
+        MockEvtSel.calls = []
+        self.run_sel(taupt=60)
+        self.assertEqual(MockEvtSel.calls, ['twotau', 'jets'])
+
+    def test_inputs_with_same_length(self):
+        self.run_sel()
+        other = mock_events(400, seed=1)
+        MockEvtSel.calls = []
+        sel = self.run_sel(events=other, uuid='def')
+        self.assertEqual(MockEvtSel.calls, ['twotau', 'jets'])
+        self.assertEqual(sel.cutflow, self.run_sel(events=other, ckptdir=False).cutflow)
+
+    def test_no_entry_identity(self):
+        objcfg = {'Tau': {'pt': 40, 'idvsjet': 3}, 'Jet': {'pt': 20, 'btag': 0.3}}
+        sel = CkptMockEvtSel(None, objcfg, {}, True, ckptdir=self.ckptdir)
+        sel.setevtsel(self.events)
+        self.assertEqual(os.listdir(self.ckptdir), [])
+        self.assertEqual(sel.cutflow, self.run_sel(ckptdir=False).cutflow)
+
+    def test_scan_resume(self):
+        ckptdir = self.ckptdir
+        class ScanMockEvtSel(CkptMockEvtSel):
+            inputkey = 'abc_0-400'
+            def __init__(self, trigcfg, objcfg, mapcfg, sequential=True):
+                super().__init__(trigcfg, objcfg, mapcfg, sequential, ckptdir=ckptdir)
+        objcfg = {'Tau': {'pt': 40, 'idvsjet': 3}, 'Jet': {'pt': 20, 'btag': 0.3}}
+        scan = ThresholdScan(ScanMockEvtSel, {'Jet': {'btag': [0.3, 0.6]}}, None, objcfg, {})
+        first = scan(self.events)
+        second = scan(self.events)
+        for i in first:
+            self.assertEqual(list(second[i].index), ['Initial', '>= 2 Taus', '>= 2 Jets', '>= 1 B-tagged'])
+            self.assertTrue(first[i].equals(second[i]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest, os, json, tempfile, shutil
+import numpy as np
+
+from tools.memgovernor import MemoryGovernor, MemoryBudgetExceeded, parse_bytes
+
+pjoin = os.path.join
+
+class TestMemoryGovernor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.job = {'files': {'root://cmseos.fnal.gov//store/ZZ.root': {'uuid': 'abc', 'steps': [[0, 40000], [40000, 80000]]}},
+                    'metadata': {'shortname': 'ZZ'}}
+        self.governor = MemoryGovernor('64GB', min_chunk=5000, interval=0.01, recordpath=pjoin(self.tmpdir, 'chunksizes.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_bytes(self):
+        self.assertEqual(parse_bytes('20GB'), 20 * 1024**3)
+        self.assertEqual(parse_bytes('512MiB'), 512 * 1024**2)
+        self.assertEqual(parse_bytes(1000), 1000)
+
+    def test_no_split(self):
+        processed = []
+        status = self.governor(self.job, lambda subjob: processed.append(next(iter(subjob['files'].values()))['steps'][0]) or 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(processed, [[0, 40000], [40000, 80000]])
+        self.assertFalse(os.path.exists(self.governor.recordpath))
+
+    def test_split_on_budget(self):
+        processed = []
+        def process(subjob):
+            start, stop = next(iter(subjob['files'].values()))['steps'][0]
+            if stop - start > 10000:
+                raise MemoryBudgetExceeded(2, 1)
+            processed.append((start, stop))
+            return 0
+        status = self.governor(self.job, process)
+        self.assertEqual(status, 0)
+        self.assertEqual(sum(stop - start for start, stop in processed), 80000)
+        self.assertEqual(processed[0], (0, 10000))
+        with open(self.governor.recordpath, 'r') as f:
+            self.assertEqual(json.load(f), {'ZZ': 10000})
+
+        restarted = MemoryGovernor('64GB', recordpath=self.governor.recordpath)
+        chunks = []
+        restarted(self.job, lambda subjob: chunks.append(next(iter(subjob['files'].values()))['uuid']) or 0)
+        self.assertEqual(len(chunks), 8)
+        self.assertEqual(chunks[1], 'abc-10000')
+
+    def test_resplit_pending(self):
+        self.job['files']['root://cmseos.fnal.gov//store/ZZ_2.root'] = {'uuid': 'def', 'steps': [[0, 40000]]}
+        aborted = []
+        def process(subjob):
+            start, stop = next(iter(subjob['files'].values()))['steps'][0]
+            if stop - start > 10000:
+                aborted.append((start, stop))
+                raise MemoryBudgetExceeded(2, 1)
+            return 0
+        self.assertEqual(self.governor(self.job, process), 0)
+        self.assertEqual(aborted, [(0, 40000), (0, 20000)])
+
+    def test_record_never_grows(self):
+        self.governor.save_record('ZZ', 5000)
+        self.governor.save_record('ZZ', 20000)
+        self.assertEqual(self.governor.load_record(), {'ZZ': 5000})
+
+        returned = [pjoin(self.tmpdir, 'chunksizes', f'job_{i}.json') for i in range(2)]
+        MemoryGovernor.write_record({'ZZ': 2500, 'WZ': 8000}, returned[0])
+        MemoryGovernor.write_record({'ZZ': 10000}, returned[1])
+        merged = MemoryGovernor.merge_records(self.governor.recordpath, returned)
+        self.assertEqual(merged, {'ZZ': 2500, 'WZ': 8000})
+        self.assertEqual(self.governor.load_record(), merged)
+        self.assertFalse(any(os.path.exists(path) for path in returned))
+
+    def test_cleanup_aborted(self):
+        outputs = set()
+        def process(subjob):
+            fileinfo = next(iter(subjob['files'].values()))
+            start, stop = fileinfo['steps'][0]
+            outputs.add(fileinfo['uuid'])
+            try:
+                if stop - start > 20000:
+                    raise MemoryBudgetExceeded(2, 1)
+            except Exception:
+                self.fail("MemoryBudgetExceeded must not be caught by except Exception")
+            return 0
+        status = self.governor(self.job, process, cleanup=lambda subjob: outputs.discard(next(iter(subjob['files'].values()))['uuid']))
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(outputs), sorted(f'abc-{start}' for start in range(0, 80000, 20000)))
+
+    def test_min_chunk(self):
+        def process(subjob):
+            raise MemoryBudgetExceeded(2, 1)
+        with self.assertRaises(MemoryError) as cm:
+            self.governor(self.job, process)
+        self.assertNotIsInstance(cm.exception, MemoryBudgetExceeded)
+        self.assertIsInstance(cm.exception.__cause__, MemoryBudgetExceeded)
+
+    def test_watch(self):
+        self.governor.limit = 0
+        with self.assertRaises(MemoryBudgetExceeded):
+            with self.governor.watch():
+                while True:
+                    np.ones(1000).sum()
+        self.assertGreater(self.governor.peak, 0)
+
+if __name__ == '__main__':
+    unittest.main()
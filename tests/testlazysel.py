@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import awkward as ak
+
+from tools.lazysel import LazyEvents, LazySelMixin, ObjectPlaceholder
+from tests.mocksel import MockEvtSel, mock_events
+
+class LazyMockEvtSel(LazySelMixin, MockEvtSel):
+    pass
+
+class TestLazySelections(unittest.TestCase):
+    def setUp(self):
+        self.events = mock_events(500)
+        self.objcfg = {'Tau': {'pt': 40, 'idvsjet': 3}, 'Jet': {'pt': 20, 'btag': 0.3}}
+
+    def test_index_composition(self):
+        lazy = LazyEvents(self.events)
+        first = np.zeros(len(self.events), dtype=bool)
+        first[::2] = True
+        selected = lazy[first]
+        second = np.arange(len(selected)) % 3 == 0
+        selected = selected[second]
+        expected = self.events[first][second]
+        self.assertEqual(len(selected), len(expected))
+        self.assertEqual(selected._cache, {})
+        self.assertEqual(ak.to_list(selected['Jet_pt']), ak.to_list(expected['Jet_pt']))
+        self.assertEqual(list(selected._cache), ['Jet_pt'])
+
+    def test_identical_results(self):
+        eager = LazyMockEvtSel(None, self.objcfg, None, True, lazy=False)
+        eager.setevtsel(self.events)
+        lazy = LazyMockEvtSel(None, self.objcfg, None, True, lazy=True)
+        lazy.setevtsel(self.events)
+        self.assertEqual(eager.cutflow, lazy.cutflow)
+        self.assertEqual(set(lazy.passed), {ObjectPlaceholder}, "Base selobjhelper should not filter the object collection in lazy mode")
+        self.assertIsInstance(lazy.saved, ak.Array)
+        self.assertEqual(ak.to_list(eager.saved), ak.to_list(lazy.saved))
+        self.assertEqual(ak.to_list(eager.objcollect['LDBjet']), ak.to_list(lazy.objcollect['LDBjet']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest, os, json, tempfile, shutil, time
+
+from tools.pilot import WorkQueue, Pilot
+
+pjoin = os.path.join
+
+class TestPilot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        jobfiles = []
+        for i in range(4):
+            jobfile = pjoin(self.tmpdir, f'ZZ_{i}.json')
+            with open(jobfile, 'w') as f:
+                json.dump({'files': {}, 'metadata': {'shortname': f'ZZ_{i}'}}, f)
+            jobfiles.append(jobfile)
+        self.queue = WorkQueue(pjoin(self.tmpdir, 'queue'), lease=1, max_attempts=2)
+        self.queue.populate(jobfiles)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_claim(self):
+        first = self.queue.claim('pilot1')
+        second = self.queue.claim('pilot2')
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.queue.jobs('pending')), 2)
+        self.assertEqual(self.queue.read_lease(first)['pilot'], 'pilot1')
+
+    def test_drain(self):
+        handled = []
+        processed = Pilot(self.queue, handled.append, heartbeat=0.1)()
+        self.assertEqual(len(handled), 4)
+        self.assertEqual(len(processed['done']), 4)
+        self.assertEqual(self.queue.jobs('pending'), [])
+        self.assertEqual(len(self.queue.jobs('done')), 4)
+        self.assertEqual(os.listdir(pjoin(self.queue.queuedir, 'running')), [])
+
+    def test_lease_expiry(self):
+        name = self.queue.claim('crashed')
+        self.assertEqual(self.queue.reap(), [])
+        past = time.time() - 5
+        os.utime(self.queue.path('running', f'{name}.lease'), (past, past))
+        self.assertEqual(self.queue.reap(), [name])
+        self.assertIn(name, self.queue.jobs('pending'))
+        self.assertEqual(self.queue.attempts(name), 1)
+
+    def test_claim_in_progress(self):
+        past = time.time() - 3600
+        for name in self.queue.jobs('pending'):
+            os.utime(self.queue.path('pending', name), (past, past))
+        name = self.queue.claim('pilot1')
+        os.remove(self.queue.path('running', f'{name}.lease'))
+        self.assertEqual(self.queue.reap(), [])
+        self.assertIn(name, self.queue.jobs('running'))
+
+    def test_reap_crashed(self):
+        crashed = self.queue.claim('crashed')
+        handled = []
+        processed = Pilot(self.queue, handled.append, heartbeat=0.1)()
+        self.assertIn(crashed, processed['done'])
+        self.assertEqual(len(self.queue.jobs('done')), 4)
+        self.assertEqual(self.queue.jobs('running'), [])
+
+    def test_failing_job(self):
+        def handler(jobfile):
+            if jobfile.endswith('ZZ_0.json'): raise RuntimeError('corrupted file')
+        processed = Pilot(self.queue, handler, heartbeat=0.1)()
+        self.assertEqual(processed['failed'], ['ZZ_0.json'])
+        self.assertEqual(self.queue.jobs('failed'), ['ZZ_0.json'])
+        self.assertEqual(len(processed['done']), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest, tempfile, shutil, glob, os
+import numpy as np
+import pandas as pd
+
+from tools.regions import RegionBuilder, invmass, deltaR
+
+def make_df(n, seed):
+    rng = np.random.default_rng(seed)
+    data = {}
+    for obj in ('LDTau', 'SDTau', 'LDBjetBYtag', 'SDBjetBYtag'):
+        data[f'{obj}_pt'] = rng.uniform(20, 200, n)
+        data[f'{obj}_eta'] = rng.uniform(-2.3, 2.3, n)
+        data[f'{obj}_phi'] = rng.uniform(-np.pi, np.pi, n)
+        data[f'{obj}_mass'] = rng.uniform(0, 10, n)
+    data['LDTau_charge'] = rng.choice([-1, 1], n)
+    data['SDTau_charge'] = rng.choice([-1, 1], n)
+    data['dataset'] = rng.choice(['TTto2L2Nu', 'ZZto4L', 'DYJetsToLL'], n)
+    data['group'] = np.where(data['dataset'] == 'ZZto4L', 'ZZ', np.where(data['dataset'] == 'DYJetsToLL', 'DYJets', 'TTbar'))
+    data['weight'] = rng.uniform(0.5, 1.5, n)
+    return pd.DataFrame(data)
+
+class TestRegionBuilder(unittest.TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.oneb = make_df(100, 0)
+        self.twob = make_df(60, 1)
+        self.builder = RegionBuilder(cachedir=self.cachedir, regroup={'Others': ['ZZto4L']})
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_kinematics(self):
+        df = pd.DataFrame({'a_pt': [50.], 'a_eta': [0.], 'a_phi': [0.], 'a_mass': [0.],
+                           'b_pt': [50.], 'b_eta': [0.], 'b_phi': [np.pi], 'b_mass': [0.]})
+        np.testing.assert_allclose(invmass(df, 'a', 'b'), [100.])
+        np.testing.assert_allclose(deltaR(df, 'a', 'b'), [np.pi])
+
+    def test_regions(self):
+        regions = self.builder(self.oneb, self.twob)
+        os_oneb = (self.oneb.LDTau_charge * self.oneb.SDTau_charge < 0)
+        os_twob = (self.twob.LDTau_charge * self.twob.SDTau_charge < 0)
+        self.assertEqual(len(regions['A']), os_twob.sum())
+        self.assertEqual(len(regions['B']), os_oneb.sum())
+        self.assertEqual(len(regions['C']), (~os_twob).sum())
+        self.assertEqual(len(regions['D']), (~os_oneb).sum())
+        self.assertTrue(regions['A']['OS'].all())
+        self.assertFalse(regions['D']['OS'].any())
+        self.assertIn('LDBjet_pt', regions.df.columns)
+        self.assertEqual(len(list(regions)), 4)
+
+    def test_regroup(self):
+        regions = self.builder(self.oneb, self.twob)
+        df = regions.df
+        self.assertTrue((df[df.dataset == 'ZZto4L'].group == 'Others').all())
+        self.assertTrue((df[df.dataset == 'TTto2L2Nu'].group == 'TTbar').all())
+        filtered = regions.filter(group='TTbar')
+        self.assertEqual(sum(len(region) for region in filtered), (df.group == 'TTbar').sum())
+
+    def test_duplicate_index(self):
+        oneb = pd.concat([make_df(50, 2), make_df(50, 3)])
+        self.assertFalse(oneb.index.is_unique)
+        regions = self.builder(oneb, self.twob)
+        self.assertEqual(len(regions.df), len(oneb) + len(self.twob))
+        derived = self.builder.derive(oneb, 'oneb')
+        np.testing.assert_allclose(derived['Tau_InvM'].to_numpy(), invmass(oneb, 'LDTau', 'SDTau'))
+        np.testing.assert_array_equal(derived['OS'].to_numpy(), (oneb.LDTau_charge * oneb.SDTau_charge < 0).to_numpy())
+
+    def test_cache(self):
+        first = self.builder(self.oneb, self.twob)
+        self.assertEqual(len(glob.glob(os.path.join(self.cachedir, '*.pkl'))), 6)
+        second = self.builder(self.oneb, self.twob)
+        pd.testing.assert_frame_equal(first.df, second.df)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import awkward as ak
+from dynaconf.utils.boxing import DynaBox
+
+from tools.scan import ThresholdScan, expand_grid, point_config
+from tests.mocksel import MockBaseSel, MockEvtSel, mock_events
+
+class MockSkimSel(MockBaseSel):
+    def __init__(self, trigcfg, objcfg, mapcfg, sequential=False):
+        super().__init__(trigcfg, objcfg, mapcfg, sequential)
+
+class TestThresholdScan(unittest.TestCase):
+    def setUp(self):
+        self.objcfg = DynaBox({'Tau': {'idvsjet': 5, 'pt': 40}, 'Jet': {'btag': 0.0614, 'pt': 20}})
+        self.scancfg = {'Jet': {'btag': [0.0614, 0.3196]}, 'Tau': {'idvsjet': [4, 5, 6]}}
+        self.events = mock_events(1000)
+
+    def test_grid(self):
+        points = expand_grid(self.scancfg)
+        self.assertEqual(len(points), 6)
+        cfg = point_config(self.objcfg, points[-1])
+        self.assertEqual(cfg['Jet']['btag'], 0.3196)
+        self.assertEqual(cfg['Tau']['idvsjet'], 6)
+        self.assertEqual(cfg['Tau']['pt'], 40)
+        self.assertEqual(self.objcfg['Jet']['btag'], 0.0614)
+
+    def test_cutflows(self):
+        MockEvtSel.calls = []
+        scan = ThresholdScan(MockEvtSel, self.scancfg, None, self.objcfg, None)
+        cutflows = scan(self.events)
+        self.assertEqual(MockEvtSel.calls.count('twotau'), 3, "Two-tau stage should be shared between grid points with the same Tau config")
+        for i, point in enumerate(scan.points):
+            nominal = MockEvtSel(None, point_config(self.objcfg, point), None)
+            nominal(self.events)
+            self.assertEqual(list(cutflows[i].index), ['Initial', '>= 2 Taus', '>= 2 Jets', '>= 1 B-tagged'])
+            self.assertEqual(cutflows[i]['raw'].iloc[-1], len(nominal.saved))
+            self.assertAlmostEqual(cutflows[i]['weighted'].iloc[-1], 0.5 * len(nominal.saved))
+
+    def test_not_sequential(self):
+        with self.assertRaises(ValueError):
+            ThresholdScan(MockSkimSel, self.scancfg, None, self.objcfg, None)
+
+    def test_combine(self):
+        scan = ThresholdScan(MockEvtSel, self.scancfg, None, self.objcfg, None)
+        cutflows = scan(self.events)
+        combined = ThresholdScan.combine([cutflows, cutflows])
+        self.assertEqual(combined[0]['raw'].iloc[0], 2000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# Stage-level checkpointing for sequential event selections.
+# A stage (e.g. two-tau or jets) stores the masks of its selobjhelper cuts and the objcollect contents at its end,
+# keyed by the input entries (uuid and step range, or run/lumi/event ids), the events and objcollect contents entering
+# the stage, the stage code and the configuration it depends on. On a rerun, a stage with a valid checkpoint replays
+# the stored masks through selobjhelper (so cutflows are identical) instead of recomputing the objects;
+# only stages whose inputs changed are recomputed.
+import os, sys, json, hashlib, inspect
+import numpy as np
+import awkward as ak
+
+pjoin = os.path.join
+
+IDFIELDS = ['run', 'luminosityBlock', 'event']
+
+def tomask(mask) -> np.ndarray:
+    """Event-level mask as a numpy boolean array."""
+    if isinstance(mask, ak.Array):
+        mask = ak.to_numpy(ak.fill_none(mask, False))
+    return np.asarray(mask, dtype=bool)
+
+def fingerprint(array) -> str:
+    """Hash of the content of an awkward/numpy array."""
+    sha = hashlib.sha1()
+    if isinstance(array, ak.Array):
+        form, length, container = ak.to_buffers(array)
+        sha.update(form.to_json().encode())
+        sha.update(str(length).encode())
+        for name in sorted(container):
+            sha.update(np.ascontiguousarray(container[name]).tobytes())
+    else:
+        sha.update(np.ascontiguousarray(array).tobytes())
+    return sha.hexdigest()
+
+class CheckpointMixin:
+    """Mixin for sequential `BaseEventSelections` subclasses. Wrap stages with `runstage` to checkpoint them in `ckptdir`.
+    Without `ckptdir`, `runstage` simply calls the stage."""
+    # library modules whose source is part of every stage key
+    ckptmodules = ['src.analysis.evtselutil', 'src.analysis.objutil']
+
+    # identity of the input entries, e.g. '{uuid}_{start}_{stop}', set on the class by `keyed_selection`
+    inputkey = None
+
+    def __init__(self, *args, ckptdir=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.ckptdir = ckptdir
+        self._recorded = None
+        self._replaying = False
+        if ckptdir is not None:
+            os.makedirs(ckptdir, exist_ok=True)
+
+    def selobjhelper(self, events, name, obj, mask):
+        if self._recorded is not None and not self._replaying:
+            self._recorded.append((name, obj.name, tomask(mask)))
+        return super().selobjhelper(events, name, obj, mask)
+
+    def entrykey(self, events):
+        """Identity of the entries entering a stage: `inputkey` if set, otherwise a hash of the
+        run/luminosityBlock/event columns. None if neither is available."""
+        if self.inputkey is not None:
+            return self.inputkey
+        if all(field in events.fields for field in IDFIELDS):
+            return '_'.join(fingerprint(events[field]) for field in IDFIELDS)
+        return None
+
+    def stagekey(self, stage, func, events, deps, entry) -> str:
+        """Hash of everything the stage output depends on: the input entries, the events and objcollect contents
+        entering the stage, the stage source code and the object selection configuration of `deps`."""
+        content = {'stage': stage,
+                   'input': entry,
+                   'nevents': len(events),
+                   'objcollect': {name: fingerprint(arr) for name, arr in sorted(self.objcollect.items())},
+                   'code': inspect.getsource(func),
+                   'libcode': self.libkey(),
+                   'objcfg': {dep: self.objselcfg[dep] for dep in deps},
+                   'mapcfg': {dep: self.mapcfg.get(dep, None) for dep in deps} if hasattr(self.mapcfg, 'get') else None}
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+    def libkey(self) -> str:
+        """Hash of the source of `ckptmodules` that are imported."""
+        sha = hashlib.sha1()
+        for name in self.ckptmodules:
+            if name in sys.modules:
+                sha.update(inspect.getsource(sys.modules[name]).encode())
+        return sha.hexdigest()
+
+    def runstage(self, stage, func, events, deps=()):
+        """Run `func(events)` as a checkpointed stage and return the surviving events.
+        
+        Parameters
+        - `stage`: str, name of the stage, e.g. 'twotau'.
+        - `func`: callable, the stage. Must apply its cuts through `selobjhelper` and return the surviving events.
+        - `deps`: list, names of the object selection blocks in selection.yaml the stage depends on, e.g. ['Tau']."""
+        if self.ckptdir is None:
+            return func(events)
+        entry = self.entrykey(events)
+        if entry is None:
+            print(f"No input key (uuid and step range) or run/luminosityBlock/event columns available, checkpointing of stage {stage} skipped")
+            return func(events)
+        key = self.stagekey(stage, func, events, deps, entry)
+        path = pjoin(self.ckptdir, f'{stage}_{key}.npz')
+        if os.path.exists(path):
+            print(f"Resuming stage {stage} from checkpoint {path}")
+            return self.resume(path, events)
+
+        self._recorded = []
+        try:
+            events = func(events)
+            self.save(path, self._recorded)
+        finally:
+            self._recorded = None
+        return events
+
+    def save(self, path, recorded) -> None:
+        """Write the cut masks and the objcollect contents of a stage (atomic rename, so partial files are never read)."""
+        arrays = {f'mask_{i}': mask for i, (_, _, mask) in enumerate(recorded)}
+        forms = {}
+        for name, arr in self.objcollect.items():
+            form, length, container = ak.to_buffers(arr)
+            forms[name] = {'form': form.to_json(), 'length': length, 'buffers': sorted(container)}
+            arrays.update({f'obj_{name}_{buf}': data for buf, data in container.items()})
+        meta = {'cuts': [(cutname, objname) for cutname, objname, _ in recorded], 'objcollect': forms}
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    def resume(self, path, events):
+        """Replay the stored cuts through `selobjhelper` (filling the cutflow as usual) and restore objcollect."""
+        with np.load(path, allow_pickle=False) as stored:
+            meta = json.loads(str(stored['meta']))
+            self._replaying = True
+            try:
+                for i, (cutname, objname) in enumerate(meta['cuts']):
+                    obj = self.getObj(objname, events)
+                    _, events = self.selobjhelper(events, cutname, obj, stored[f'mask_{i}'])
+            finally:
+                self._replaying = False
+            objcollect = {}
+            for name, info in meta['objcollect'].items():
+                container = {buf: stored[f'obj_{name}_{buf}'] for buf in info['buffers']}
+                objcollect[name] = ak.from_buffers(ak.forms.from_json(info['form']), info['length'], container)
+        self.objcollect.clear()
+        self.objcollect.update(objcollect)
+        return events
+
+def keyed_selection(evtselclass, job):
+    """Return `evtselclass` with `inputkey` set to the uuid and step range of a single-file job,
+    so that its checkpoints are keyed by the input entries."""
+    if not issubclass(evtselclass, CheckpointMixin):
+        return evtselclass
+    (fileinfo,) = job['files'].values()
+    steps = '_'.join(f'{start}-{stop}' for start, stop in fileinfo.get('steps', []))
+    return type(evtselclass.__name__, (evtselclass,), {'inputkey': f"{fileinfo['uuid']}_{steps}"})
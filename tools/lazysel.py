@@ -0,0 +1,76 @@
+# Lazy index-composition mode for sequential event selections.
+# Instead of copying `events` and the object collection after every cut, each cut only composes an index array
+# into the original events. Columns are gathered for the surviving rows when they are accessed.
+import numpy as np
+import awkward as ak
+
+class LazyEvents:
+    """Row-index view of an events array. Boolean/index selections compose indices, field access gathers the column on demand."""
+    def __init__(self, base, idx=None) -> None:
+        """Initialize the view.
+        
+        Parameters
+        - `base`: ak.Array, the events array as read from the file.
+        - `idx`: np.ndarray, indices of the rows of `base` in this view. All rows if None."""
+        self.base = base
+        self.idx = np.arange(len(base)) if idx is None else idx
+        self._cache = {}
+
+    def __len__(self) -> int:
+        return len(self.idx)
+
+    @property
+    def fields(self) -> list:
+        return self.base.fields
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._cache:
+                self._cache[key] = self.base[key][self.idx]
+            return self._cache[key]
+        if isinstance(key, list) and all(isinstance(k, str) for k in key):
+            return ak.zip({k: self[k] for k in key}, depth_limit=1)
+        key = ak.fill_none(key, False) if isinstance(key, ak.Array) else key
+        key = ak.to_numpy(key) if isinstance(key, ak.Array) else np.asarray(key)
+        return LazyEvents(self.base, self.idx[key])
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('base', 'idx'):
+            raise AttributeError(name)
+        if name in self.base.fields:
+            return self[name]
+        raise AttributeError(name)
+
+    def materialize(self, columns=None) -> ak.Array:
+        """Gather the selected columns (all by default) for the rows in this view, in one pass."""
+        if columns is None:
+            return self.base[self.idx]
+        return ak.zip({col: self[col] for col in columns}, depth_limit=1)
+
+class ObjectPlaceholder:
+    """Stands in for the object collection handed to the base `selobjhelper` in lazy mode, so that the base class
+    only does the cutflow bookkeeping and the event selection, without filtering a copy of the objects."""
+    def __init__(self, name) -> None:
+        self.name = name
+
+class LazySelMixin:
+    """Mixin for sequential `BaseEventSelections` subclasses. With `lazy=True`, `selobjhelper` composes row indices
+    instead of materializing filtered copies of the events and the object collection after every cut.
+    The object collection is rebuilt on the index view, so its columns are only gathered when accessed.
+    The cutflow bookkeeping of the base class is unchanged; events are materialized once in `saveWeights`."""
+    def __init__(self, *args, lazy=False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy = lazy
+
+    def selobjhelper(self, events, name, obj, mask):
+        if not self.lazy:
+            return super().selobjhelper(events, name, obj, mask)
+        if not isinstance(events, LazyEvents):
+            events = LazyEvents(events)
+        _, events = super().selobjhelper(events, name, ObjectPlaceholder(obj.name), mask)
+        return self.getObj(obj.name, events), events
+
+    def saveWeights(self, events):
+        if isinstance(events, LazyEvents):
+            events = events.materialize()
+        return super().saveWeights(events)
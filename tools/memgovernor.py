@@ -0,0 +1,174 @@
+# Adaptive memory governor for event selection jobs.
+# Each file of a job is processed in step ranges of an adaptive size while the RSS of the process (and its children)
+# is sampled. When the RSS gets close to the budget the current range is aborted, split in halves and retried.
+# The chunk size that worked is recorded per dataset so that later jobs start from it. On condor the record is
+# transferred in with the job and returned under exec/chunksizes/, where jobsub.sh merges it before the next submission.
+import os, gc, json, signal, re, argparse
+from collections import deque
+from contextlib import contextmanager
+import psutil
+
+pjoin = os.path.join
+
+class MemoryBudgetExceeded(BaseException):
+    """Raised inside the processing of a chunk when the RSS exceeds the governor limit.
+    Derives from BaseException (like KeyboardInterrupt) so that `except Exception` blocks in the processing
+    code do not swallow it when the signal arrives inside them."""
+    def __init__(self, rss, limit) -> None:
+        super().__init__(f"RSS {rss/1024**3:.2f}GB exceeded limit {limit/1024**3:.2f}GB")
+        self.rss = rss
+        self.limit = limit
+
+def parse_bytes(size) -> int:
+    """Convert a memory string such as '20GB' or '512MB' (or a number of bytes) to bytes."""
+    if isinstance(size, (int, float)): return int(size)
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?i?B?)\s*', size, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Cannot parse memory size {size}")
+    value, unit = float(match.group(1)), match.group(2).upper().rstrip('B').rstrip('I')
+    return int(value * 1024**('KMGT'.index(unit) + 1 if unit else 0))
+
+class MemoryGovernor:
+    """Process the files of a job in step ranges whose size adapts to a memory budget."""
+    def __init__(self, budget, threshold=0.85, min_chunk=1000, interval=0.5, recordpath=None) -> None:
+        """Initialize the governor.
+        
+        Parameters
+        - `budget`: str or int, memory available to the job, e.g. '8GB'.
+        - `threshold`: float, fraction of the budget at which the current chunk is aborted and split.
+        - `min_chunk`: int, smallest number of entries per chunk. Chunks of this size are not split further.
+        - `interval`: float, seconds between RSS samples.
+        - `recordpath`: str, json file with the chunk size per dataset. Read at start, updated when a chunk is split."""
+        self.budget = parse_bytes(budget)
+        self.limit = int(self.budget * threshold)
+        self.min_chunk = min_chunk
+        self.interval = interval
+        self.recordpath = recordpath
+        self.peak = 0
+        self.proc = psutil.Process()
+
+    def rss(self) -> int:
+        """Resident memory of this process and its children."""
+        rss = self.proc.memory_info().rss
+        for child in self.proc.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return rss
+
+    @contextmanager
+    def watch(self):
+        """Sample the RSS every `interval` seconds while the block runs and raise `MemoryBudgetExceeded` in it
+        when the limit is exceeded. Must be used from the main thread."""
+        def check(signum, frame):
+            rss = self.rss()
+            self.peak = max(self.peak, rss)
+            if rss > self.limit:
+                raise MemoryBudgetExceeded(rss, self.limit)
+
+        previous = signal.signal(signal.SIGALRM, check)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    def load_record(self) -> dict:
+        if self.recordpath is None or not os.path.exists(self.recordpath): return {}
+        with open(self.recordpath, 'r') as f:
+            return json.load(f)
+
+    def save_record(self, dataset, chunksize) -> None:
+        """Record the chunk size of a dataset. The record only ever shrinks: the smaller of the stored and the new size is kept.
+        Written with an atomic replace so concurrent jobs never read a partial file."""
+        if self.recordpath is None: return
+        record = self.load_record()
+        record[dataset] = min(record.get(dataset, chunksize), chunksize)
+        self.write_record(record, self.recordpath)
+
+    @staticmethod
+    def write_record(record, path) -> None:
+        dirname = os.path.dirname(path)
+        if dirname: os.makedirs(dirname, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def merge_records(recordpath, paths) -> dict:
+        """Merge the records returned by finished jobs into `recordpath`, keeping the smallest chunk size per dataset,
+        and remove the merged files."""
+        record = {}
+        for path in [recordpath] + list(paths):
+            if not os.path.exists(path): continue
+            with open(path, 'r') as f:
+                for dataset, chunksize in json.load(f).items():
+                    record[dataset] = min(record.get(dataset, chunksize), chunksize)
+        MemoryGovernor.write_record(record, recordpath)
+        for path in paths:
+            if os.path.exists(path): os.remove(path)
+        return record
+
+    @staticmethod
+    def split_steps(steps, chunksize) -> list:
+        """Split [[start, stop], ...] step ranges into ranges of at most `chunksize` entries."""
+        ranges = []
+        for start, stop in steps:
+            for lo in range(start, stop, chunksize):
+                ranges.append((lo, min(lo + chunksize, stop)))
+        return ranges
+
+    def __call__(self, job, process, cleanup=None) -> int:
+        """Process all files of a job chunk by chunk.
+        
+        Parameters
+        - `job`: dict, job description with `files` ({path: {'uuid', 'steps', ...}}) and `metadata` (with `shortname`).
+        - `process`: callable, processes a job dict restricted to one file and one step range. Returns 0 on success.
+        - `cleanup`: callable, optional. Called with the sub-job of an aborted range to remove its partial outputs before the halves are retried.
+        The uuid of each sub-job is suffixed with the first entry of its range so that outputs of different chunks do not collide.
+        
+        Return
+        - int, 0 if all chunks succeeded, otherwise the first non-zero return code.
+        
+        Raises
+        - `MemoryError`: when a range of `min_chunk` entries or fewer still exceeds the budget."""
+        dataset = job['metadata'].get('shortname', 'default')
+        chunksize = self.load_record().get(dataset, None)
+        status = 0
+        for filename, fileinfo in job['files'].items():
+            steps = fileinfo.get('steps') or [[0, fileinfo['num_entries']]]
+            pending = deque(self.split_steps(steps, chunksize or max(stop - start for start, stop in steps)))
+            while pending:
+                start, stop = pending.popleft()
+                subjob = {'files': {filename: {**fileinfo, 'steps': [[start, stop]], 'uuid': f"{fileinfo.get('uuid', '')}-{start}"}},
+                          'metadata': job['metadata']}
+                try:
+                    with self.watch():
+                        result = process(subjob)
+                except MemoryBudgetExceeded as e:
+                    gc.collect()
+                    if cleanup is not None:
+                        cleanup(subjob)
+                    if stop - start <= self.min_chunk:
+                        # an ordinary exception, so that callers (e.g. the pilot) can fail the job instead of dying
+                        raise MemoryError(f"{e}: entries [{start}, {stop}) of {filename} do not fit even at the minimum chunk size") from e
+                    mid = start + (stop - start) // 2
+                    chunksize = min(chunksize or mid - start, mid - start)
+                    pending = deque(self.split_steps([[start, mid], [mid, stop]] + list(pending), chunksize))
+                    self.save_record(dataset, chunksize)
+                    print(f"{e}: splitting entries [{start}, {stop}) of {filename}, chunk size is now {chunksize}")
+                    continue
+                gc.collect()
+                if result != 0 and status == 0:
+                    status = result
+        return status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge the chunk size records returned by finished jobs into one record.')
+    parser.add_argument('record', type=str, help='record read by the next submission')
+    parser.add_argument('returned', type=str, nargs='*', help='records returned by the jobs, removed after merging')
+    args = parser.parse_args()
+    print(MemoryGovernor.merge_records(args.record, args.returned))
@@ -0,0 +1,194 @@
+# Pilot/work-queue execution mode.
+# A long-lived pilot claims job JSONs from a queue directory on a shared filesystem through atomic renames,
+# keeps a heartbeat on the claimed job and processes jobs until the queue is empty.
+# Jobs of crashed pilots are released back to the queue once their lease expires.
+import os, glob, json, shutil, socket, time, threading, traceback, argparse
+
+pjoin = os.path.join
+
+class WorkQueue:
+    """Directory-based work queue: `pending/` -> `running/` -> `done/` or `failed/`.
+    A claimed job `running/<job>.json` has a lease file `running/<job>.json.lease` whose mtime is the last heartbeat."""
+    STATES = ['pending', 'running', 'done', 'failed']
+
+    def __init__(self, queuedir, lease=600, max_attempts=3) -> None:
+        """Initialize the queue, creating the state directories if needed.
+        
+        Parameters
+        - `queuedir`: str, queue directory on a filesystem shared by all pilots.
+        - `lease`: float, seconds without heartbeat after which a running job is considered abandoned.
+        - `max_attempts`: int, number of claims after which an abandoned or failing job is moved to `failed/`."""
+        self.queuedir = queuedir
+        self.lease = lease
+        self.max_attempts = max_attempts
+        for state in self.STATES:
+            os.makedirs(pjoin(queuedir, state), exist_ok=True)
+
+    def path(self, state, name) -> str:
+        return pjoin(self.queuedir, state, name)
+
+    def jobs(self, state) -> list:
+        return sorted(os.path.basename(f) for f in glob.glob(pjoin(self.queuedir, state, '*.json')))
+
+    def populate(self, jobfiles) -> int:
+        """Copy job JSONs into `pending/`. Returns the number of jobs added."""
+        for jobfile in jobfiles:
+            tmp = self.path('pending', f'.{os.path.basename(jobfile)}.tmp')
+            shutil.copy(jobfile, tmp)
+            os.rename(tmp, self.path('pending', os.path.basename(jobfile)))
+        return len(jobfiles)
+
+    def claim(self, pilotid):
+        """Atomically move the first available pending job to `running/`. Returns its name or None if the queue is empty."""
+        for name in self.jobs('pending'):
+            attempts = self.attempts(name)
+            try:
+                # refresh the mtime before the rename (which keeps it), so that a claim whose lease is not yet
+                # written is never mistaken for an abandoned job by `reap`
+                os.utime(self.path('pending', name))
+                os.rename(self.path('pending', name), self.path('running', name))
+            except FileNotFoundError:
+                continue
+            self.write_lease(name, pilotid, attempts + 1)
+            return name
+        return None
+
+    def attempts(self, name) -> int:
+        """Number of previous claims of a job, kept in `pending/<job>.json.attempts` when a job is released."""
+        try:
+            with open(self.path('pending', f'{name}.attempts'), 'r') as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_lease(self, name, pilotid, attempt) -> None:
+        with open(self.path('running', f'{name}.lease'), 'w') as f:
+            json.dump({'pilot': pilotid, 'attempt': attempt, 'claimed': time.time()}, f)
+
+    def read_lease(self, name) -> dict:
+        try:
+            with open(self.path('running', f'{name}.lease'), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'attempt': 1}
+
+    def heartbeat(self, name) -> None:
+        """Refresh the lease of a running job."""
+        os.utime(self.path('running', f'{name}.lease'))
+
+    def finish(self, name, state='done') -> None:
+        """Move a running job to `done/` or `failed/` and drop its lease."""
+        os.rename(self.path('running', name), self.path(state, name))
+        for suffix in ('lease', 'attempts'):
+            for st in ('running', 'pending'):
+                if os.path.exists(self.path(st, f'{name}.{suffix}')): os.remove(self.path(st, f'{name}.{suffix}'))
+
+    def release(self, name) -> str:
+        """Put a running job back into `pending/` (or `failed/` after `max_attempts`). Returns the new state."""
+        attempt = self.read_lease(name).get('attempt', 1)
+        if attempt >= self.max_attempts:
+            self.finish(name, 'failed')
+            return 'failed'
+        with open(self.path('pending', f'{name}.attempts'), 'w') as f:
+            f.write(str(attempt))
+        os.rename(self.path('running', name), self.path('pending', name))
+        if os.path.exists(self.path('running', f'{name}.lease')): os.remove(self.path('running', f'{name}.lease'))
+        return 'pending'
+
+    def reap(self) -> list:
+        """Release running jobs whose lease expired (pilot crashed or was evicted). Returns the released job names."""
+        released = []
+        now = time.time()
+        for name in self.jobs('running'):
+            leasefile = self.path('running', f'{name}.lease')
+            try:
+                expired = now - os.path.getmtime(leasefile) > self.lease
+            except FileNotFoundError:
+                # claim in progress: the job mtime is the claim time
+                expired = now - os.path.getmtime(self.path('running', name)) > self.lease
+            if not expired: continue
+            try:
+                self.release(name)
+                released.append(name)
+            except FileNotFoundError:
+                pass
+        return released
+
+class Pilot:
+    """Long-lived worker processing jobs from a `WorkQueue` until it is empty."""
+    def __init__(self, queue, handler, heartbeat=60, idle_wait=None, pilotid=None) -> None:
+        """Initialize the pilot.
+        
+        Parameters
+        - `queue`: WorkQueue, the shared queue.
+        - `handler`: callable, called with the path of the claimed job JSON. Raising marks the attempt as failed.
+        - `heartbeat`: float, seconds between lease refreshes. Must be well below `queue.lease`.
+        - `idle_wait`: float, seconds to keep polling for released jobs while other pilots are still running. None (default) to poll until
+        no job is running, so that the jobs of a crashed pilot are reaped once their lease expires. Should exceed `queue.lease + heartbeat` otherwise.
+        - `pilotid`: str, identifier written into the leases. Defaults to host:pid."""
+        self.queue = queue
+        self.handler = handler
+        self.heartbeat = heartbeat
+        self.idle_wait = idle_wait
+        self.pilotid = pilotid or f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = {'done': [], 'failed': []}
+
+    def __call__(self) -> dict:
+        """Claim and process jobs until the queue is drained. Returns the names of processed jobs per outcome."""
+        idle_since = None
+        while True:
+            self.queue.reap()
+            name = self.queue.claim(self.pilotid)
+            if name is None:
+                if not self.queue.jobs('running'): break
+                idle_since = idle_since or time.time()
+                if self.idle_wait is not None and time.time() - idle_since >= self.idle_wait: break
+                time.sleep(min(self.heartbeat, self.queue.lease) / 2)
+                continue
+            idle_since = None
+            self.process(name)
+        return self.processed
+
+    def process(self, name) -> None:
+        print(f"Pilot {self.pilotid} processing {name}")
+        stop = threading.Event()
+        beat = threading.Thread(target=self._beat, args=(name, stop), daemon=True)
+        beat.start()
+        try:
+            self.handler(self.queue.path('running', name))
+        except Exception:
+            traceback.print_exc()
+            stop.set(); beat.join()
+            try:
+                state = self.queue.release(name)
+            except FileNotFoundError:
+                return
+            if state == 'failed': self.processed['failed'].append(name)
+        else:
+            stop.set(); beat.join()
+            try:
+                self.queue.finish(name, 'done')
+            except FileNotFoundError:
+                print(f"Lease on {name} expired while processing, job was released to another pilot")
+                return
+            self.processed['done'].append(name)
+
+    def _beat(self, name, stop) -> None:
+        while not stop.wait(self.heartbeat):
+            try:
+                self.queue.heartbeat(name)
+            except FileNotFoundError:
+                return
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the pilot work queue.')
+    parser.add_argument('queuedir', type=str, help='queue directory on a shared filesystem')
+    parser.add_argument('--add', type=str, nargs='+', default=[], help='job JSONs to add to the queue')
+    parser.add_argument('--reap', action='store_true', help='release running jobs with expired leases')
+    parser.add_argument('--lease', type=float, default=600, help='lease duration in seconds')
+    args = parser.parse_args()
+
+    wq = WorkQueue(args.queuedir, lease=args.lease)
+    if args.add: print(f"Added {wq.populate(args.add)} jobs to {args.queuedir}")
+    if args.reap: print(f"Released {wq.reap()}")
+    print({state: len(wq.jobs(state)) for state in WorkQueue.STATES})
@@ -0,0 +1,158 @@
+# Vectorized ABCD region building for the plotting workflow.
+# Region A is defined as: OS + 2 b-tagged
+# Region B is defined as: OS + 1 b-tagged
+# Region C is defined as: SS + 2 b-tagged
+# Region D is defined as: SS + 1 b-tagged
+import os, hashlib
+import numpy as np
+import pandas as pd
+
+pjoin = os.path.join
+
+REGIONS = ['A', 'B', 'C', 'D']
+DERIVED = ['Tau_dR', 'Bjet_dR', 'Tau_InvM', 'Bjet_InvM', 'OS']
+
+def fourmomentum(df, prefix) -> tuple:
+    """Return (E, px, py, pz) arrays of the object `prefix` from its pt, eta, phi and mass columns."""
+    pt, eta, phi, mass = (df[f'{prefix}_{var}'].to_numpy(dtype=np.float64) for var in ('pt', 'eta', 'phi', 'mass'))
+    px, py, pz = pt * np.cos(phi), pt * np.sin(phi), pt * np.sinh(eta)
+    return np.sqrt(px**2 + py**2 + pz**2 + mass**2), px, py, pz
+
+def invmass(df, prefix1, prefix2) -> np.ndarray:
+    """Invariant mass of the pair of objects `prefix1` and `prefix2`."""
+    E1, px1, py1, pz1 = fourmomentum(df, prefix1)
+    E2, px2, py2, pz2 = fourmomentum(df, prefix2)
+    m2 = (E1 + E2)**2 - (px1 + px2)**2 - (py1 + py2)**2 - (pz1 + pz2)**2
+    return np.sqrt(np.clip(m2, 0, None))
+
+def deltaR(df, prefix1, prefix2) -> np.ndarray:
+    """Delta R between the objects `prefix1` and `prefix2`."""
+    deta = df[f'{prefix1}_eta'].to_numpy(dtype=np.float64) - df[f'{prefix2}_eta'].to_numpy(dtype=np.float64)
+    dphi = df[f'{prefix1}_phi'].to_numpy(dtype=np.float64) - df[f'{prefix2}_phi'].to_numpy(dtype=np.float64)
+    dphi = (dphi + np.pi) % (2 * np.pi) - np.pi
+    return np.hypot(deta, dphi)
+
+class RegionBuilder:
+    """Derive the kinematic columns once per dataset, cache them on disk and split the events into the four ABCD regions.
+    Replaces running `add_inv_mass` through `CSVPlotter.postprocess_csv(extraprocess=selOS/selSS)` once per region."""
+    def __init__(self, cachedir=None, regroup=None, group_col='group', dataset_col='dataset') -> None:
+        """Initialize the region builder.
+        
+        Parameters
+        - `cachedir`: str, directory where derived columns are cached per dataset. No caching if None.
+        - `regroup`: dict, {new group: [keywords]}. Datasets whose name contains any keyword are assigned to the new group,
+        e.g. {'Others': ['ZH_HToBB_ZToQQ', 'ZZto4L', 'ZZto2L2Nu', 'ZZto2Nu2Q']}.
+        - `group_col`/`dataset_col`: str, names of the group and dataset columns in the postprocessed dataframes."""
+        self.cachedir = cachedir
+        self.regroup = regroup or {}
+        self.group_col = group_col
+        self.dataset_col = dataset_col
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok=True)
+
+    def __call__(self, oneb_df, twob_df) -> 'Regions':
+        """Build the four regions from the postprocessed (weighted, no extraprocess) outputs of the one-b and two-b selections.
+        
+        Parameters
+        - `oneb_df`: pd.DataFrame, output of the ==1 b-tagged selection (regions B and D).
+        - `twob_df`: pd.DataFrame, output of the >=2 b-tagged selection (regions A and C)."""
+        oneb_df = self.derive(oneb_df, 'oneb')
+        twob_df = self.derive(twob_df, 'twob')
+        nb = np.concatenate([np.ones(len(oneb_df), dtype=np.int8), np.full(len(twob_df), 2, dtype=np.int8)])
+        df = pd.concat([oneb_df, twob_df], ignore_index=True)
+
+        # A=0 (OS, 2b), B=1 (OS, 1b), C=2 (SS, 2b), D=3 (SS, 1b)
+        code = np.where(df['OS'].to_numpy(), 0, 2) + (nb == 1)
+        order = np.argsort(code, kind='stable')
+        df = df.iloc[order].reset_index(drop=True)
+        df['region'] = pd.Categorical.from_codes(code[order], categories=REGIONS)
+        self.assign_groups(df)
+
+        bounds = np.searchsorted(code[order], np.arange(len(REGIONS) + 1))
+        return Regions(df, {name: (bounds[i], bounds[i+1]) for i, name in enumerate(REGIONS)})
+
+    def derive(self, df, tag) -> pd.DataFrame:
+        """Add the derived kinematic columns (dR, invariant masses, OS) to `df`, one dataset at a time,
+        reusing cached columns when the input kinematics are unchanged."""
+        df = df.rename(columns=lambda col: col.replace('LDBjetBYtag_', 'LDBjet_').replace('SDBjetBYtag_', 'SDBjet_'))
+        df = df.drop(columns=DERIVED, errors='ignore')
+        # filled by position: postprocessed frames concatenated from per-file csvs have duplicate index labels
+        columns = {col: np.zeros(len(df), dtype=bool) if col == 'OS' else np.full(len(df), np.nan) for col in DERIVED}
+        for dataset, idx in df.groupby(self.dataset_col, sort=False, observed=True).indices.items():
+            derived = self.derive_dataset(df.iloc[idx], f'{tag}_{dataset}')
+            for col in DERIVED:
+                columns[col][idx] = derived[col].to_numpy()
+        for col, arr in columns.items():
+            df[col] = arr
+        return df
+
+    def derive_dataset(self, df, key) -> pd.DataFrame:
+        """Compute (or load from cache) the derived columns of one dataset."""
+        inputs = [f'{obj}_{var}' for obj in ('LDTau', 'SDTau', 'LDBjet', 'SDBjet') for var in ('pt', 'eta', 'phi', 'mass')] + ['LDTau_charge', 'SDTau_charge']
+        cachefile = None
+        if self.cachedir is not None:
+            digest = hashlib.sha1(pd.util.hash_pandas_object(df[inputs], index=False).to_numpy().tobytes()).hexdigest()[:16]
+            cachefile = pjoin(self.cachedir, f'{key}_{digest}.pkl')
+            if os.path.exists(cachefile):
+                return pd.read_pickle(cachefile)
+
+        derived = pd.DataFrame({'Tau_dR': deltaR(df, 'LDTau', 'SDTau'),
+                                'Bjet_dR': deltaR(df, 'LDBjet', 'SDBjet'),
+                                'Tau_InvM': invmass(df, 'LDTau', 'SDTau'),
+                                'Bjet_InvM': invmass(df, 'LDBjet', 'SDBjet'),
+                                'OS': (df['LDTau_charge'].to_numpy() * df['SDTau_charge'].to_numpy()) < 0})
+        if cachefile is not None:
+            derived.to_pickle(cachefile)
+        return derived
+
+    def assign_groups(self, df) -> None:
+        """Regroup datasets with a lookup over the unique dataset names instead of a row-wise apply."""
+        if not self.regroup: return
+        datasets = df[self.dataset_col].astype('category')
+        lookup = {}
+        for name in datasets.cat.categories:
+            for group, keywords in self.regroup.items():
+                if any(keyword in name for keyword in keywords):
+                    lookup[name] = group
+                    break
+        codes = datasets.cat.codes.to_numpy()
+        mapped = np.array([lookup.get(name) for name in datasets.cat.categories] + [None], dtype=object)[codes]
+        df[self.group_col] = np.where(pd.isna(mapped), df[self.group_col].to_numpy(dtype=object), mapped)
+
+class Regions:
+    """The four ABCD regions stored in one dataframe sorted by region. Each region is a contiguous slice."""
+    def __init__(self, df, bounds) -> None:
+        self.df = df
+        self.bounds = bounds
+
+    def __getitem__(self, region) -> pd.DataFrame:
+        start, stop = self.bounds[region]
+        return self.df.iloc[start:stop]
+
+    def __getattr__(self, region) -> pd.DataFrame:
+        if region in REGIONS: return self[region]
+        raise AttributeError(region)
+
+    def __iter__(self):
+        """Iterate over regions A, B, C, D, so that `cp.plot_fourRegions(*regions, ...)` works directly."""
+        return (self[region] for region in REGIONS)
+    
+    def __len__(self) -> int:
+        return len(REGIONS)
+
+    def filter(self, **conditions) -> 'Regions':
+        """Return the regions restricted to rows matching all column == value conditions, e.g. `filter(group='TTbar')`."""
+        mask = np.ones(len(self.df), dtype=bool)
+        for col, value in conditions.items():
+            mask &= (self.df[col] == value).to_numpy()
+        codes = self.df['region'].cat.codes.to_numpy()[mask]
+        bounds = np.searchsorted(codes, np.arange(len(REGIONS) + 1))
+        return Regions(self.df[mask].reset_index(drop=True), {name: (bounds[i], bounds[i+1]) for i, name in enumerate(REGIONS)})
+
+    def plot_fourRegions(self, plotter, *args, **kwargs):
+        """Call `CSVPlotter.plot_fourRegions` with regions A, B, C, D."""
+        return plotter.plot_fourRegions(*self, *args, **kwargs)
+
+    def plot_shape(self, plotter, regions, labels, *args, **kwargs):
+        """Call `CSVPlotter.plot_shape` on a subset of regions, e.g. `plot_shape(cp, ['C', 'D'], [...], H_mass, ...)`."""
+        return plotter.plot_shape([self[region] for region in regions], labels, *args, **kwargs)
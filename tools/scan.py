@@ -0,0 +1,128 @@
+# Threshold-scan mode: evaluate a grid of selection.yaml working points on events read once.
+# Stages whose object configuration does not change between grid points (e.g. the two-tau selection when only
+# Jet thresholds are scanned) are evaluated once and shared by all grid points.
+import os, json, itertools, inspect
+import pandas as pd
+import awkward as ak
+from dynaconf.utils.boxing import DynaBox
+
+pjoin = os.path.join
+
+def expand_grid(scancfg) -> list:
+    """Expand a scan configuration into the list of grid points.
+    
+    Parameters
+    - `scancfg`: dict, {object name: {cut name: [thresholds]}}, e.g. {'Jet': {'btag': [0.0614, 0.3196]}, 'Tau': {'idvsjet': [5, 6]}}
+    
+    Return
+    - list of dict, {(object name, cut name): threshold} for every combination of thresholds."""
+    keys = [(objname, cutname) for objname, cuts in scancfg.items() for cutname in cuts]
+    values = [scancfg[objname][cutname] for objname, cutname in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+def point_config(objcfg, point) -> DynaBox:
+    """Return a copy of the object selection configuration with the thresholds of one grid point."""
+    cfg = json.loads(json.dumps(objcfg))
+    for (objname, cutname), value in point.items():
+        cfg[objname][cutname] = value
+    return DynaBox(cfg)
+
+def point_label(point) -> str:
+    """Short label of a grid point, e.g. 'Jet.btag=0.3196_Tau.idvsjet=6'."""
+    return '_'.join(f'{objname}.{cutname}={value}' for (objname, cutname), value in point.items())
+
+def is_sequential(evtselclass) -> bool:
+    """Whether `evtselclass` applies its cuts sequentially by default, i.e. through `selobjhelper` where the scan records them."""
+    param = inspect.signature(evtselclass.__init__).parameters.get('sequential', None)
+    return param is not None and param.default is True
+
+class ThresholdScan:
+    """Run a sequential event selection class once per grid point on the same in-memory events,
+    recording one cutflow per grid point."""
+    def __init__(self, evtselclass, scancfg, trigcfg, objcfg, mapcfg, weight='Generator_weight') -> None:
+        """Initialize the scan.
+        
+        Parameters
+        - `evtselclass`: class, sequential event selection class, e.g. from `switch_selections`.
+        - `scancfg`: dict, grid of thresholds per object cut (`selection.scan`).
+        - `trigcfg`, `objcfg`, `mapcfg`: nominal configurations passed to `evtselclass`.
+        - `weight`: str, name of the per-event weight field used for the weighted cutflow."""
+        if not is_sequential(evtselclass):
+            raise ValueError(f"{evtselclass.__name__} is not sequential: its cuts do not go through selobjhelper and cannot be scanned")
+        self.evtselclass = evtselclass
+        self.points = expand_grid(scancfg)
+        self.trigcfg = trigcfg
+        self.objcfg = objcfg
+        self.mapcfg = mapcfg
+        self.weight = weight
+    
+    def __call__(self, events) -> dict:
+        """Evaluate all grid points on `events`.
+        
+        Return
+        - dict, {grid point index: cutflow dataframe with raw and weighted counts after each cut}"""
+        shared = {}
+        cutflows = {}
+        for i, point in enumerate(self.points):
+            evtsel = self.scanselection(point_config(self.objcfg, point), shared)
+            # same entry point as Processor (trigger selection and bookkeeping included), so yields match the nominal cutflow
+            evtsel(events)
+            cutflows[i] = evtsel.scancutflow(events)
+        return cutflows
+
+    def scanselection(self, objcfg, shared):
+        """Instantiate the event selection with the grid point configuration, instrumented to record the cutflow
+        and to share the two-tau stage between grid points with identical Tau configuration."""
+        weight = self.weight
+
+        class ScanSel(self.evtselclass):
+            def selobjhelper(self, events, name, obj, mask):
+                obj, events = super().selobjhelper(events, name, obj, mask)
+                self.scancf[name] = (len(events), ak.sum(events[weight]) if weight in events.fields else float(len(events)))
+                return obj, events
+
+            def seltwotaus(self, events):
+                key = json.dumps(self.objselcfg['Tau'], sort_keys=True, default=str)
+                if key not in shared:
+                    self.scancf.clear()
+                    selected = super().seltwotaus(events)
+                    shared[key] = (selected, dict(self.objcollect), dict(self.scancf))
+                selected, objcollect, cutflow = shared[key]
+                self.objcollect.update(objcollect)
+                self.scancf.update(cutflow)
+                return selected
+
+            def scancutflow(self, events):
+                total = (len(events), ak.sum(events[weight]) if weight in events.fields else float(len(events)))
+                rows = {'Initial': total, **self.scancf}
+                return pd.DataFrame.from_dict(rows, orient='index', columns=['raw', 'weighted'])
+
+        evtsel = ScanSel(self.trigcfg, objcfg, self.mapcfg, sequential=True)
+        evtsel.scancf = {}
+        return evtsel
+
+    def write(self, cutflows, outdir, prefix) -> pd.DataFrame:
+        """Write one cutflow csv per grid point and a table of final yields per grid point.
+        
+        Parameters
+        - `cutflows`: dict, output of `__call__` (possibly summed over several files).
+        - `outdir`: str, output directory.
+        - `prefix`: str, prefix of the output files, e.g. '{shortname}_{uuid}'."""
+        rows = []
+        for i, cutflow in cutflows.items():
+            cutflow.to_csv(pjoin(outdir, f'{prefix}_scan{i}_cutflow.csv'))
+            row = {f'{objname}.{cutname}': value for (objname, cutname), value in self.points[i].items()}
+            row.update({'label': point_label(self.points[i]), 'raw': cutflow['raw'].iloc[-1], 'weighted': cutflow['weighted'].iloc[-1]})
+            rows.append(row)
+        yields = pd.DataFrame(rows, index=pd.Index(list(cutflows.keys()), name='point'))
+        yields.to_csv(pjoin(outdir, f'{prefix}_scanyield.csv'))
+        return yields
+
+    @staticmethod
+    def combine(cutflows_list) -> dict:
+        """Sum the cutflows of several files grid point by grid point."""
+        combined = {}
+        for cutflows in cutflows_list:
+            for i, cutflow in cutflows.items():
+                combined[i] = cutflow if i not in combined else combined[i].add(cutflow, fill_value=0).reindex(combined[i].index)
+        return combined
@@ -0,0 +1,230 @@
+# Memory-mapped column store for training on selection outputs.
+# The builder converts the region csv files (e.g. RegionC.csv/RegionD.csv) chunk by chunk into one typed .npy file per column,
+# so that src.learning classes never need the full dataframe in memory.
+import os, json
+import numpy as np
+import pandas as pd
+
+pjoin = os.path.join
+
+class TrainingCacheBuilder:
+    """Convert selection outputs once into a memory-mapped, typed column store with a precomputed train/test split."""
+    def __init__(self, outdir, weight='weight', test_size=0.25, seed=42, dtype='float32', chunksize=200000, batch_size=4096, drop_columns=None) -> None:
+        """Initialize the builder.
+        
+        Parameters
+        - `outdir`: str, directory where the column store is written. Created if it does not exist.
+        - `weight`: str, name of the per-event weight column. Always stored in float64.
+        - `test_size`: float, fraction of entries assigned to the test split.
+        - `seed`: int, seed of the random train/test split.
+        - `dtype`: str, numpy dtype used to store the numeric feature columns.
+        - `chunksize`: int, number of csv rows read at a time.
+        - `batch_size`: int, default mini-batch size of the returned `TrainingCache`.
+        - `drop_columns`: list, default keywords of columns not to be stored."""
+        self.outdir = outdir
+        self.weight = weight
+        self.test_size = test_size
+        self.seed = seed
+        self.dtype = np.dtype(dtype)
+        self.chunksize = chunksize
+        self.batch_size = batch_size
+        self.drop_columns = drop_columns or []
+        os.makedirs(outdir, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings=None, **kwargs) -> 'TrainingCacheBuilder':
+        """Initialize the builder from `trainingsetting` (config/trainingsetting.toml). Keyword arguments override the settings."""
+        if settings is None:
+            from config.projectconfg import trainingsetting as settings
+        keys = {'outdir': 'CACHE_DIR', 'weight': 'WEIGHT', 'test_size': 'TEST_SIZE', 'seed': 'SEED', 'dtype': 'DTYPE',
+                'chunksize': 'CHUNKSIZE', 'batch_size': 'BATCH_SIZE', 'drop_columns': 'DROP_COLUMNS'}
+        for param, key in keys.items():
+            if param not in kwargs and settings.get(key, None) is not None:
+                kwargs[param] = settings.get(key)
+        return cls(**kwargs)
+    
+    def __call__(self, sources, drop_columns=None) -> 'TrainingCache':
+        """Build the column store and return it opened read-only.
+        
+        Parameters
+        - `sources`: dict, {source label: csv path or list of csv paths}, e.g. {'RegionC': 'RegionC.csv', 'RegionD': 'RegionD.csv'}.
+        The label of each entry is stored in the `source` column.
+        - `drop_columns`: list, keywords of columns not to be stored (same convention as `Reweighter.preprocess_data`).
+        Defaults to the `drop_columns` of the builder."""
+        sources = {label: [paths] if isinstance(paths, str) else list(paths) for label, paths in sources.items()}
+        drop_columns = self.drop_columns if drop_columns is None else drop_columns
+
+        dtypes = self.infer_schema(sources, drop_columns)
+        nrows = sum(self.count_rows(path) for paths in sources.values() for path in paths)
+
+        columns = {name: np.lib.format.open_memmap(pjoin(self.outdir, f'{name}.npy'), mode='w+', dtype=dtype, shape=(nrows,))
+                   for name, dtype in dtypes.items()}
+        columns['source'] = np.lib.format.open_memmap(pjoin(self.outdir, 'source.npy'), mode='w+', dtype=np.int16, shape=(nrows,))
+        vocabs = {name: [] for name, dtype in dtypes.items() if dtype == np.int32}
+        vocabs['source'] = list(sources.keys())
+
+        start = 0
+        for code, (label, paths) in enumerate(sources.items()):
+            for path in paths:
+                for chunk in pd.read_csv(path, index_col=0, chunksize=self.chunksize):
+                    stop = start + len(chunk)
+                    for name, arr in columns.items():
+                        if name == 'source': arr[start:stop] = code
+                        elif name in vocabs: arr[start:stop] = self.encode(chunk[name], vocabs[name])
+                        else: arr[start:stop] = chunk[name].to_numpy(dtype=arr.dtype)
+                    start = stop
+        for arr in columns.values(): arr.flush()
+        del columns
+
+        self.write_split(nrows)
+        meta = {'nrows': nrows, 'weight': self.weight, 'test_size': self.test_size, 'seed': self.seed, 'batch_size': self.batch_size,
+                'columns': {**{name: np.dtype(dtype).str for name, dtype in dtypes.items()}, 'source': np.dtype(np.int16).str},
+                'vocabs': vocabs}
+        with open(pjoin(self.outdir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        return TrainingCache(self.outdir)
+
+    def infer_schema(self, sources, drop_columns) -> dict:
+        """Read the first chunk of the first source to determine the stored dtype of each column.
+        Numeric columns are stored in `self.dtype`, booleans in uint8, strings as int32 category codes."""
+        first = next(iter(sources.values()))[0]
+        head = next(iter(pd.read_csv(first, index_col=0, chunksize=1000)))
+        dtypes = {}
+        for name, dtype in head.dtypes.items():
+            if any(kwd in name for kwd in drop_columns) and name != self.weight: continue
+            if name == self.weight: dtypes[name] = np.float64
+            elif pd.api.types.is_bool_dtype(dtype): dtypes[name] = np.uint8
+            elif pd.api.types.is_numeric_dtype(dtype): dtypes[name] = self.dtype
+            else: dtypes[name] = np.int32
+        if self.weight not in dtypes:
+            raise KeyError(f"Weight column {self.weight} not found in {first}")
+        return dtypes
+
+    def count_rows(self, path) -> int:
+        """Count the number of rows of a csv file without loading it."""
+        return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=self.chunksize))
+    
+    def write_split(self, nrows) -> None:
+        """Shuffle the entries once and store the train/test indices (sorted for sequential memmap access)."""
+        rng = np.random.default_rng(self.seed)
+        perm = rng.permutation(nrows)
+        ntest = int(round(nrows * self.test_size))
+        np.save(pjoin(self.outdir, 'test_idx.npy'), np.sort(perm[:ntest]))
+        np.save(pjoin(self.outdir, 'train_idx.npy'), np.sort(perm[ntest:]))
+
+    @staticmethod
+    def encode(series, vocab) -> np.ndarray:
+        """Encode string values into integer codes, extending `vocab` in place with unseen values."""
+        lookup = {value: code for code, value in enumerate(vocab)}
+        for value in pd.unique(series.astype(str)):
+            if value not in lookup:
+                lookup[value] = len(vocab)
+                vocab.append(value)
+        return series.astype(str).map(lookup).to_numpy(dtype=np.int32)
+
+class TrainingCache:
+    """Read-only view of a column store written by `TrainingCacheBuilder`. Columns are memory-mapped and only loaded when accessed."""
+    def __init__(self, path) -> None:
+        self.path = path
+        with open(pjoin(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.weight = self.meta['weight']
+        self.batch_size = self.meta.get('batch_size', 4096)
+        self.vocabs = self.meta['vocabs']
+        self._columns = {}
+    
+    def __len__(self) -> int:
+        return self.meta['nrows']
+    
+    @property
+    def columns(self) -> list:
+        return list(self.meta['columns'].keys())
+
+    def features(self, exclude=None) -> list:
+        """Return the feature column names, i.e. all columns except the weight, category and `exclude` columns."""
+        exclude = set(exclude or []) | {self.weight} | set(self.vocabs.keys())
+        return [name for name in self.columns if name not in exclude]
+    
+    def column(self, name) -> np.memmap:
+        """Return the memory-mapped array of one column."""
+        if name not in self._columns:
+            if name not in self.meta['columns']:
+                raise KeyError(f"Column {name} not found in {self.path}")
+            self._columns[name] = np.load(pjoin(self.path, f'{name}.npy'), mmap_mode='r')
+        return self._columns[name]
+    
+    def code(self, name, value) -> int:
+        """Return the integer code of a category value, e.g. `code('group', 'TTbar')`."""
+        return self.vocabs[name].index(value)
+    
+    def indices(self, split=None, where=None) -> np.ndarray:
+        """Return the row indices of a split, optionally filtered on category values.
+        
+        Parameters
+        - `split`: 'train', 'test' or None for all entries.
+        - `where`: dict, {category column: value or list of values}, e.g. {'source': 'RegionD', 'group': 'TTbar'}."""
+        idx = np.arange(len(self)) if split is None else np.load(pjoin(self.path, f'{split}_idx.npy'))
+        for name, values in (where or {}).items():
+            values = [values] if isinstance(values, str) else values
+            codes = [self.code(name, value) for value in values]
+            idx = idx[np.isin(self.column(name)[idx], codes)]
+        return idx
+    
+    def take(self, idx, columns=None) -> dict:
+        """Gather the given rows of the selected columns into memory."""
+        columns = columns or self.columns
+        return {name: np.asarray(self.column(name)[idx]) for name in columns}
+
+    def to_frame(self, split=None, columns=None, where=None, decode=False) -> pd.DataFrame:
+        """Load a subset of the store as a dataframe, e.g. to hand over to `Reweighter`.
+        
+        Parameters
+        - `columns`: list, columns to load. Defaults to all columns.
+        - `decode`: bool, whether to map category codes back to their string values."""
+        idx = self.indices(split, where)
+        df = pd.DataFrame(self.take(idx, columns), index=idx)
+        if decode:
+            for name in set(df.columns) & set(self.vocabs.keys()):
+                df[name] = pd.Categorical.from_codes(df[name], categories=self.vocabs[name])
+        return df
+
+    def iterbatches(self, batch_size=None, split='train', columns=None, where=None, target=None, shuffle=True, seed=None):
+        """Yield mini-batches (X, w, y) read directly from the memory-mapped columns.
+        
+        Parameters
+        - `batch_size`: int, entries per batch. Defaults to the `batch_size` the store was built with.
+        - `columns`: list, feature columns stacked into X. Defaults to `self.features()`.
+        - `target`: str, name of the label column, e.g. 'OS'. y is None if not given.
+        - `shuffle`: bool, whether to shuffle the batch order. Entries inside a batch stay sorted for sequential reads."""
+        batch_size = batch_size or self.batch_size
+        columns = columns or self.features(exclude=[target] if target else None)
+        idx = self.indices(split, where)
+        starts = np.arange(0, len(idx), batch_size)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(starts)
+        for start in starts:
+            rows = idx[start:start+batch_size]
+            X = np.stack([self.column(name)[rows] for name in columns], axis=1).astype(np.float32, copy=False)
+            w = np.asarray(self.column(self.weight)[rows])
+            y = np.asarray(self.column(target)[rows]) if target else None
+            yield X, w, y
+    
+    def torch_loader(self, batch_size=None, split='train', columns=None, where=None, target=None, shuffle=True, seed=None):
+        """Same as `iterbatches` but yields torch tensors, for the `SimpleClassifier` training loop."""
+        import torch
+
+        for X, w, y in self.iterbatches(batch_size, split, columns, where, target, shuffle, seed):
+            yield torch.from_numpy(X), torch.from_numpy(w), (torch.from_numpy(y.astype(np.int64)) if y is not None else None)
+
+    def reweighter_inputs(self, original, target, columns=None, where=None, split=None) -> tuple:
+        """Return the (original, target) dataframes expected by `Reweighter`, loading only the needed columns.
+        
+        Parameters
+        - `original`/`target`: str, source labels, e.g. 'RegionD' and 'RegionC'.
+        - `columns`: list, feature columns to load. The weight column is always included."""
+        columns = list(dict.fromkeys((columns or self.features()) + [self.weight]))
+        where = where or {}
+        ori = self.to_frame(split, columns, {**where, 'source': original})
+        tar = self.to_frame(split, columns, {**where, 'source': target})
+        return ori, tar